@@ -1,14 +1,47 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, HTTPException
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 import asyncio
+import anyio
 from dotenv import load_dotenv
-from rag_system import setup_rag_system, query_rag_system
+from rag_system import setup_rag_system, stream_rag_system
 
 # Load environment variables
 load_dotenv()
 
-app = FastAPI(title="RAG Chatbot API")
+# Max number of queries running in the worker threadpool at once
+RAG_THREAD_LIMIT = 200
+
+# Seconds a query waits for a still-initializing RAG system before a 503
+RAG_READY_TIMEOUT = 30
+
+async def initialize_rag(app):
+    try:
+        print("🚀 Setting up RAG system in background...")
+        # Setup blocks (and drives its own event loop for async ingestion),
+        # so run it in a worker thread rather than on the server's loop
+        app.state.query_engine, app.state.response_cache = await run_in_threadpool(setup_rag_system)
+        app.state.ready.set()
+        print("✅ RAG system ready!")
+    except Exception as e:
+        print(f"❌ Failed to initialize RAG system: {e}")
+
+@asynccontextmanager
+async def lifespan(app):
+    # Blocking RAG queries run in anyio's threadpool; raise its default of 40
+    anyio.to_thread.current_default_thread_limiter().total_tokens = RAG_THREAD_LIMIT
+    app.state.query_engine = None
+    app.state.response_cache = None
+    app.state.ready = asyncio.Event()
+    # Spawn async task so startup is non-blocking; keep a reference so it isn't GC'd
+    app.state.init_task = asyncio.create_task(initialize_rag(app))
+    yield
+    app.state.init_task.cancel()
+
+app = FastAPI(title="RAG Chatbot API", lifespan=lifespan)
 
 # Enable CORS for React frontend
 app.add_middleware(
@@ -25,40 +58,38 @@ app.add_middleware(
 class QueryRequest(BaseModel):
     question: str
 
-# Global state
-query_engine = None
-rag_ready = False
-
-async def initialize_rag():
-    global query_engine, rag_ready
-    try:
-        print("🚀 Setting up RAG system in background...")
-        query_engine = setup_rag_system()
-        rag_ready = True
-        print("✅ RAG system ready!")
-    except Exception as e:
-        print(f"❌ Failed to initialize RAG system: {e}")
-
-@app.on_event("startup")
-async def startup_event():
-    # Spawn async task so startup is non-blocking
-    asyncio.create_task(initialize_rag())
-
 @app.get("/")
 async def root():
     return {"message": "RAG Chatbot API is running!"}
 
 @app.post("/api/query")
 async def query_endpoint(request: QueryRequest):
-    if not rag_ready or query_engine is None:
-        raise HTTPException(status_code=503, detail="RAG system still initializing, try again later.")
+    if not app.state.ready.is_set():
+        # Hold requests that arrive during startup instead of bouncing them,
+        # but stop waiting as soon as setup finishes, successfully or not
+        ready_wait = asyncio.ensure_future(app.state.ready.wait())
+        try:
+            await asyncio.wait(
+                {ready_wait, app.state.init_task},
+                timeout=RAG_READY_TIMEOUT,
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+        finally:
+            ready_wait.cancel()
+        if not app.state.ready.is_set():
+            if app.state.init_task.done():
+                # Setup finished without setting ready, so it failed
+                raise HTTPException(status_code=503, detail="RAG system failed to initialize.")
+            raise HTTPException(status_code=503, detail="RAG system still initializing, try again later.")
     
     try:
-        response = query_rag_system(query_engine, request.question)
-        return {"response": response}
+        # stream_rag_system blocks on network I/O; keep it off the event loop
+        chunks = await run_in_threadpool(stream_rag_system, app.state.query_engine, app.state.response_cache, request.question)
+        # Starlette drains the sync chunk iterator in its threadpool as well
+        return StreamingResponse(chunks, media_type="text/plain")
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/health")
 async def health_check():
-    return {"status": "healthy", "rag_initialized": rag_ready}
+    return {"status": "healthy", "rag_initialized": app.state.ready.is_set()}
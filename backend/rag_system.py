@@ -1,33 +1,263 @@
+import hashlib
 import os
+import pickle
 import random
+import queue
+import re
+import tempfile
+import threading
+import time
+import httpx
 import requests
+from collections import OrderedDict
+from contextlib import contextmanager
+from concurrent.futures import Future
 from pathlib import Path
 from llama_index import SimpleDirectoryReader, ServiceContext, VectorStoreIndex
 from llama_index.vector_stores import DeepLakeVectorStore
 from llama_index.storage.storage_context import StorageContext  
-from llama_index.embeddings.openai import OpenAIEmbedding
+from llama_index.embeddings.openai import OpenAIEmbedding, get_embeddings
 from llama_index.prompts import PromptTemplate
+from llama_index.callbacks.schema import CBEventType, EventPayload
+from llama_index.postprocessor import CohereRerank
+from llama_index.bridge.pydantic import PrivateAttr
+from openai import OpenAI
 import deeplake
 import numpy as np
 import json
 
+try:
+    import fcntl
+except ImportError:
+    # No flock on Windows; local dev runs a single worker anyway
+    fcntl = None
+
+try:
+    import ahocorasick
+except ImportError:
+    # pyahocorasick is a C extension; fall back to precompiled regexes without it
+    ahocorasick = None
+
 EMBED_DIM = 1536
+# Chunks per OpenAI embedding request when building the index
+EMBED_BATCH_SIZE = 256
+DOWNLOAD_CHUNK_SIZE = 1 << 16
+CHUNK_SIZE = 512
+CHUNK_OVERLAP = 64
+# Candidates fetched from DeepLake, and how many survive reranking into the prompt
+RETRIEVE_TOP_K = 20
+RERANK_TOP_N = 4
+# Parsed text chunks are pickled here, keyed by corpus hash and chunking params
+NODE_CACHE_DIR = Path("./.cache")
+# uvicorn workers take this lock so only one downloads, parses and builds at a time
+SETUP_LOCK_PATH = NODE_CACHE_DIR / "setup.lock"
+QUERY_CACHE_SIZE = 4096
+RESPONSE_CACHE_SIZE = 1024
+SEMANTIC_CACHE_THRESHOLD = 0.97
+# Stream nothing until this much of the answer has passed the relevance check
+RELEVANCE_PREFIX_CHARS = 120
+# Concurrent query embeddings arriving within this window share one API call
+QUERY_BATCH_WINDOW = 0.02
+QUERY_BATCH_SIZE = 64
+
+# One pooled HTTP/2 client so OpenAI calls reuse warm TLS connections
+OPENAI_HTTP_CLIENT = httpx.Client(
+    http2=True,
+    limits=httpx.Limits(max_keepalive_connections=64, max_connections=128),
+)
+
+class QueryEmbeddingBatcher:
+    """
+    Coalesce concurrent single-query embedding calls into batched API calls
+    """
+    def __init__(self, embed_batch, window=QUERY_BATCH_WINDOW, max_batch=QUERY_BATCH_SIZE):
+        self.embed_batch = embed_batch
+        self.window = window
+        self.max_batch = max_batch
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._flusher = None
+    
+    def embed(self, text):
+        """
+        Block until the batch containing text has been embedded
+        """
+        future = Future()
+        self._queue.put((text, future))
+        self._ensure_flusher()
+        return future.result()
+    
+    def _ensure_flusher(self):
+        with self._lock:
+            if self._flusher is None:
+                self._flusher = threading.Thread(target=self._flush_forever, daemon=True)
+                self._flusher.start()
+    
+    def _next_batch(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return batch
+    
+    def _flush_forever(self):
+        while True:
+            batch = self._next_batch()
+            try:
+                embs = self.embed_batch([text for text, _ in batch])
+                # A short result would otherwise leave some callers blocked forever
+                if len(embs) != len(batch):
+                    raise ValueError(f"Expected {len(batch)} embeddings, got {len(embs)}")
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future), emb in zip(batch, embs):
+                future.set_result(emb)
 
 class Float32Embedding(OpenAIEmbedding):
+    # LRU of question -> embedding so repeated questions skip the OpenAI call
+    _query_cache: OrderedDict = PrivateAttr(default_factory=OrderedDict)
+    _query_cache_lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+    _query_batcher: QueryEmbeddingBatcher = PrivateAttr(default=None)
+    
+    def _get_client(self):
+        # Same as the base class, but on the shared pooled HTTP/2 transport.
+        # Only the sync client is swapped: async ingestion needs an httpx.AsyncClient
+        kwargs = {**self._get_credential_kwargs(), "http_client": OPENAI_HTTP_CLIENT}
+        if not self.reuse_client:
+            return OpenAI(**kwargs)
+        if self._client is None:
+            self._client = OpenAI(**kwargs)
+        return self._client
+    
     def _to_f32(self, emb): 
-        return np.array(emb, dtype=np.float32).tolist()
+        # np.asarray is a no-op for vectors that are already float32
+        return np.asarray(emb, dtype=np.float32)
+    
+    def _batch_to_f32(self, embs):
+        # Cast the whole batch at once; each row is a float32 view
+        return list(np.asarray(embs, dtype=np.float32))
     
     def get_text_embedding(self, text): 
         return self._to_f32(super().get_text_embedding(text))
     
+    def _query_cache_key(self, q):
+        return q.strip().lower()
+    
+    def _query_cache_get(self, key):
+        with self._query_cache_lock:
+            emb = self._query_cache.get(key)
+            if emb is not None:
+                self._query_cache.move_to_end(key)
+            return emb
+    
+    def _query_cache_put(self, key, emb):
+        # Cached vectors are shared between requests, so freeze them
+        emb.setflags(write=False)
+        with self._query_cache_lock:
+            self._query_cache[key] = emb
+            self._query_cache.move_to_end(key)
+            if len(self._query_cache) > QUERY_CACHE_SIZE:
+                self._query_cache.popitem(last=False)
+    
+    def _embed_query_batched(self, q):
+        with self._query_cache_lock:
+            if self._query_batcher is None:
+                self._query_batcher = QueryEmbeddingBatcher(self.get_query_embedding_batch)
+        return self._query_batcher.embed(q)
+    
     def get_query_embedding(self, q):   
-        return self._to_f32(super().get_query_embedding(q))
+        # Same callback event as the base class, so handlers see cache hits too
+        with self.callback_manager.event(
+            CBEventType.EMBEDDING, payload={EventPayload.SERIALIZED: self.to_dict()}
+        ) as event:
+            key = self._query_cache_key(q)
+            emb = self._query_cache_get(key)
+            if emb is None:
+                emb = self._embed_query_batched(q)
+                self._query_cache_put(key, emb)
+            
+            event.on_end(
+                payload={EventPayload.CHUNKS: [q], EventPayload.EMBEDDINGS: [emb]},
+            )
+        return emb
+    
+    def get_text_embedding_batch(self, texts, **kwargs):  
+        return self._batch_to_f32(super().get_text_embedding_batch(texts, **kwargs))
     
-    def get_text_embedding_batch(self, texts):  
-        return [self._to_f32(e) for e in super().get_text_embedding_batch(texts)]
+    async def aget_text_embedding_batch(self, texts, **kwargs):
+        return self._batch_to_f32(await super().aget_text_embedding_batch(texts, **kwargs))
     
-    def get_query_embedding_batch(self, qs):    
-        return [self._to_f32(e) for e in super().get_query_embedding_batch(qs)]
+    def get_query_embedding_batch(self, qs, **kwargs):    
+        # BaseEmbedding has no batched query call; use the query engine directly
+        client = self._get_client()
+        embs = get_embeddings(client, qs, engine=self._query_engine, **self.additional_kwargs)
+        # Guarantee unit length so ResponseCache can compare by dot product alone;
+        # DeepLake's COS search still divides by both norms on every candidate
+        return list(unit_normalize(np.asarray(embs, dtype=np.float32)))
+
+class ResponseCache:
+    """
+    Two-tier answer cache: exact match on the normalized question first,
+    then cosine similarity against recently answered questions
+    """
+    def __init__(self, embed_model, size=RESPONSE_CACHE_SIZE, threshold=SEMANTIC_CACHE_THRESHOLD):
+        self.embed_model = embed_model
+        self.size = size
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._exact = OrderedDict()
+        # Ring buffer of unit-length question vectors and their answers
+        self._vecs = np.zeros((size, EMBED_DIM), dtype=np.float32)
+        self._answers = [None] * size
+        self._count = 0
+        self._next = 0
+    
+    def _key(self, question):
+        return question.strip().lower()
+    
+    def get(self, question):
+        """
+        Return (answer, question_vector); answer is None on a miss
+        """
+        key = self._key(question)
+        with self._lock:
+            answer = self._exact.get(key)
+            if answer is not None:
+                self._exact.move_to_end(key)
+                return answer, None
+        
+        # Float32Embedding already returns unit-length float32 query vectors
+        qv = self.embed_model.get_query_embedding(question)
+        with self._lock:
+            if self._count:
+                # Vectors are unit length, so cosine is a single dot product
+                sims = self._vecs[:self._count] @ qv
+                best = int(np.argmax(sims))
+                if sims[best] >= self.threshold:
+                    return self._answers[best], qv
+        return None, qv
+    
+    def put(self, question, qv, answer):
+        key = self._key(question)
+        with self._lock:
+            self._exact[key] = answer
+            self._exact.move_to_end(key)
+            if len(self._exact) > self.size:
+                self._exact.popitem(last=False)
+            
+            # Overwrite the oldest slot once the buffer is full
+            self._vecs[self._next] = qv
+            self._answers[self._next] = answer
+            self._next = (self._next + 1) % self.size
+            self._count = min(self._count + 1, self.size)
 
 def normalize_metadata(meta):
     if meta is None: 
@@ -37,6 +267,54 @@ def normalize_metadata(meta):
                 for k,v in meta.items()}
     return {"value": str(meta)}
 
+def stack_embeddings(nodes):
+    """
+    Copy node embeddings into one contiguous (len(nodes), EMBED_DIM) float32 array;
+    nodes without an embedding get a zero row
+    """
+    embs = np.zeros((len(nodes), EMBED_DIM), dtype=np.float32)
+    for i, n in enumerate(nodes):
+        emb = getattr(n, "embedding", None)
+        if emb is not None:
+            embs[i] = emb
+    return embs
+
+def unit_normalize(embs):
+    """
+    Scale each row of a float32 array to unit length in place; zero rows stay zero
+    """
+    norms = np.linalg.norm(embs, axis=-1, keepdims=True)
+    embs /= np.maximum(norms, 1e-12)
+    return embs
+
+@contextmanager
+def _atomic_writer(path):
+    """
+    Yield a binary file that replaces path only once fully written; the temp
+    file is uniquely named and hidden, so concurrent writers never share it
+    """
+    f = tempfile.NamedTemporaryFile(dir=path.parent, prefix=f".{path.name}.", suffix=".part", delete=False)
+    tmp_path = Path(f.name)
+    try:
+        with f:
+            yield f
+        tmp_path.replace(path)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+
+@contextmanager
+def _setup_lock():
+    """
+    Hold an exclusive lock shared by every uvicorn worker on this machine
+    """
+    NODE_CACHE_DIR.mkdir(exist_ok=True)
+    with open(SETUP_LOCK_PATH, "w") as lock_file:
+        if fcntl is not None:
+            # Released when the file is closed
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        yield
+
 def download_paul_graham_data():
     """
     Download Paul Graham essay data - same as your existing code
@@ -53,11 +331,13 @@ def download_paul_graham_data():
         url = "https://raw.githubusercontent.com/run-llama/llama_index/main/docs/docs/examples/data/paul_graham/paul_graham_essay.txt"
         
         try:
-            response = requests.get(url)
-            response.raise_for_status()  # Raise an exception for bad status codes
-            
-            with open(essay_path, 'w', encoding='utf-8') as f:
-                f.write(response.text)
+            # Stream to a temp file so memory stays bounded and an interrupted
+            # download never leaves a truncated essay behind
+            with requests.get(url, stream=True) as response:
+                response.raise_for_status()  # Raise an exception for bad status codes
+                with _atomic_writer(essay_path) as f:
+                    for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                        f.write(chunk)
             
             print(f"✅ Successfully downloaded essay to {essay_path}")
         except requests.exceptions.RequestException as e:
@@ -68,25 +348,62 @@ def download_paul_graham_data():
     
     return paul_graham_dir
 
-def setup_rag_system():
+def _corpus_digest(data_dir):
+    h = hashlib.blake2b(digest_size=16)
+    # Hidden files (e.g. an in-progress download) are skipped, as SimpleDirectoryReader does
+    for path in sorted(p for p in data_dir.iterdir() if p.is_file() and not p.name.startswith(".")):
+        h.update(path.name.encode())
+        h.update(path.read_bytes())
+    return h.hexdigest()
+
+def load_nodes(data_dir, node_parser):
     """
-    Setup RAG system with automatic data download
+    Parse the documents in data_dir into text chunks with node_parser, reusing
+    the pickled chunks from a previous boot when the files are unchanged
     """
-    # Download Paul Graham data (your existing approach)
-    paul_graham_dir = download_paul_graham_data()
+    digest = _corpus_digest(data_dir)
+    cache_path = NODE_CACHE_DIR / f"nodes_{digest}_{CHUNK_SIZE}_{CHUNK_OVERLAP}.pkl"
+    if cache_path.exists():
+        try:
+            with open(cache_path, 'rb') as f:
+                nodes = pickle.load(f)
+            print(f"📝 Loaded {len(nodes)} cached text chunks from {cache_path}")
+            return nodes
+        except Exception as e:
+            print(f"⚠️ Ignoring unreadable chunk cache {cache_path}: {e}")
     
     # Load documents (your existing code)
     print("📖 Loading documents...")
-    documents = SimpleDirectoryReader(str(paul_graham_dir)).load_data()
+    documents = SimpleDirectoryReader(str(data_dir)).load_data()
     print(f"✅ Loaded {len(documents)} documents")
     
-    # Initialize service context
-    service_context = ServiceContext.from_defaults(chunk_size=512, chunk_overlap=64)
-    node_parser = service_context.node_parser
     nodes = node_parser.get_nodes_from_documents(documents)
     print(f"📝 Created {len(nodes)} text chunks")
     
-    embed_model = Float32Embedding()
+    NODE_CACHE_DIR.mkdir(exist_ok=True)
+    with _atomic_writer(cache_path) as f:
+        pickle.dump(nodes, f, protocol=pickle.HIGHEST_PROTOCOL)
+    return nodes
+
+def setup_rag_system():
+    """
+    Setup RAG system with automatic data download;
+    returns (query_engine, response_cache)
+    """
+    # Workers start together; serialize setup so only the first one downloads,
+    # parses and creates the DeepLake dataset, and the rest reuse its results
+    with _setup_lock():
+        return _setup_rag_system()
+
+def _setup_rag_system():
+    # Download Paul Graham data (your existing approach)
+    paul_graham_dir = download_paul_graham_data()
+    
+    embed_model = Float32Embedding(embed_batch_size=EMBED_BATCH_SIZE)
+    
+    # Initialize service context; indexes only pick up embed_model through it
+    service_context = ServiceContext.from_defaults(embed_model=embed_model, chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+    nodes = load_nodes(paul_graham_dir, service_context.node_parser)
     
     # Setup Deep Lake vector store
     dataset_path = "hub://lemojames101/LlamaIndex_paulgraham_essays"
@@ -116,8 +433,9 @@ def setup_rag_system():
         # Monkey-patch add to sanitize nodes
         old_add = vector_store.add
         def safe_add(nodes, **kwargs):
-            for n in nodes:
-                n.embedding = np.array(getattr(n, "embedding", np.zeros(EMBED_DIM)), dtype=np.float32)
+            embs = unit_normalize(stack_embeddings(nodes))
+            for n, emb in zip(nodes, embs):
+                n.embedding = emb
                 if hasattr(n, "metadata"): 
                     n.metadata = normalize_metadata(n.metadata)
                 if hasattr(n, "text") and n.text is not None: 
@@ -128,13 +446,13 @@ def setup_rag_system():
         # Build index
         print("🔧 Building vector index...")
         storage_context = StorageContext.from_defaults(vector_store=vector_store)
-        index = VectorStoreIndex(nodes, storage_context=storage_context, embed_model=embed_model, show_progress=True)
+        # use_async sends the embedding batches concurrently instead of one by one
+        index = VectorStoreIndex(nodes, storage_context=storage_context, service_context=service_context, use_async=True, show_progress=True)
         print("✅ Built new vector index")
     
     # Create index from existing store
     if 'index' not in locals():
-        storage_context = StorageContext.from_defaults(vector_store=vector_store)
-        index = VectorStoreIndex.from_vector_store(vector_store=vector_store, storage_context=storage_context, embed_model=embed_model)
+        index = VectorStoreIndex.from_vector_store(vector_store=vector_store, service_context=service_context)
     
     # Create query engine with custom prompt to stay within scope
     custom_prompt = PromptTemplate(
@@ -150,97 +468,237 @@ def setup_rag_system():
         "Answer based only on the context above: "
     )
     
+    if os.getenv("COHERE_API_KEY"):
+        # Retrieve wide, then let the reranker pick the few chunks the LLM sees
+        similarity_top_k = RETRIEVE_TOP_K
+        node_postprocessors = [CohereRerank(top_n=RERANK_TOP_N)]
+    else:
+        # Re-ranking by the store's own cosine score would only truncate
+        similarity_top_k = RERANK_TOP_N
+        node_postprocessors = []
+    
     query_engine = index.as_query_engine(
-        similarity_top_k=10,
+        similarity_top_k=similarity_top_k,
+        node_postprocessors=node_postprocessors,
         text_qa_template=custom_prompt,
         streaming=True
     )
+    # Shares embed_model, so the retriever's query embedding on a miss is an LRU hit
+    response_cache = ResponseCache(embed_model)
     
     print("🎯 RAG system setup complete!")
-    return query_engine
+    return query_engine, response_cache
+
+# Keywords that indicate the response is from Paul Graham's content
+PG_INDICATORS = [
+    "paul graham", "y combinator", "yc", "startup", "lisp", "viaweb",
+    "hacker", "programming", "essay", "venture capital", "silicon valley",
+    "founder", "entrepreneur", "technology", "software", "computer science",
+    "arc", "painting", "art", "harvard", "mit", "writer", "investor"
+]
+
+# Generic responses that indicate lack of relevant information
+IRRELEVANT_INDICATORS = [
+    "i don't know", "i'm not sure", "i don't have information",
+    "i cannot find", "no information", "not mentioned", "unclear",
+    "i apologize", "i'm sorry", "i don't have access",
+    "based on general knowledge", "in general", "typically",
+    "i don't have information about this topic in paul graham's essays"
+]
+
+# Phrasing that suggests the response is drawing on specific essays
+CONCEPT_INDICATORS = [
+    "according to", "mentioned", "discussed", "explained", "wrote about",
+    "believes", "argues", "suggests", "recommends", "experience", "opinion"
+]
+
+# Bit tags for the keyword classes, so one scan can report all three
+_PG, _IRRELEVANT, _CONCEPT = 1, 2, 4
+_KEYWORD_CLASSES = (
+    (_PG, PG_INDICATORS),
+    (_IRRELEVANT, IRRELEVANT_INDICATORS),
+    (_CONCEPT, CONCEPT_INDICATORS),
+)
+
+def _build_keyword_matcher():
+    if ahocorasick is None:
+        # One alternation per class, case-insensitive so callers can skip .lower()
+        return [(bit, re.compile("|".join(map(re.escape, keywords)), re.IGNORECASE))
+                for bit, keywords in _KEYWORD_CLASSES]
+    # A single automaton over every keyword; each value is its class bitmask
+    automaton = ahocorasick.Automaton()
+    for bit, keywords in _KEYWORD_CLASSES:
+        for keyword in keywords:
+            automaton.add_word(keyword, automaton.get(keyword, 0) | bit)
+    automaton.make_automaton()
+    return automaton
+
+def _match_text(text):
+    # The automaton matches lowercase keywords only; the regexes ignore case
+    return text.lower() if ahocorasick is not None else text
+
+def _keyword_classes(text):
+    """
+    Return the bitmask of keyword classes found in text
+    """
+    seen = 0
+    if ahocorasick is None:
+        for bit, regex in _KEYWORD_MATCHER:
+            if regex.search(text):
+                seen |= bit
+        return seen
+    # Single C-level pass over text
+    for _, bits in _KEYWORD_MATCHER.iter(text):
+        seen |= bits
+    return seen
+
+_KEYWORD_MATCHER = _build_keyword_matcher()
+
+# Text kept from the previous chunk so keywords split across chunks still match
+_KEYWORD_OVERLAP = max(map(len, PG_INDICATORS + IRRELEVANT_INDICATORS + CONCEPT_INDICATORS)) - 1
+
+class RelevanceScanner:
+    """
+    Incremental is_relevant_response: feed the answer chunk by chunk and ask
+    for a verdict at any point; each chunk is matched once, plus a short
+    overlap with the previous one, so the growing prefix is never rescanned
+    """
+    def __init__(self, question):
+        self.question = question
+        # Prepared and checked on first need only, then reused for every verdict
+        self._question_pg = None
+        # Bitmask of the keyword classes found in the text fed so far
+        self.seen = 0
+        self.length = 0
+        # Offsets of the first and last non-whitespace characters seen
+        self._content_start = None
+        self._content_end = 0
+        self._tail = ""
+    
+    def feed(self, chunk):
+        text = self._tail + _match_text(chunk)
+        self.seen |= _keyword_classes(text)
+        self._tail = text[-_KEYWORD_OVERLAP:]
+        
+        content = chunk.lstrip()
+        if content:
+            if self._content_start is None:
+                self._content_start = self.length + len(chunk) - len(content)
+            self._content_end = self.length + len(chunk.rstrip())
+        self.length += len(chunk)
+    
+    def _question_has_pg(self):
+        if self._question_pg is None:
+            self._question_pg = bool(_keyword_classes(_match_text(self.question)) & _PG)
+        return self._question_pg
+    
+    def stripped_length(self):
+        """
+        len(text.strip()) for everything fed so far
+        """
+        if self._content_start is None:
+            return 0
+        return self._content_end - self._content_start
+    
+    def verdict(self):
+        """
+        Return True/False once the text fed so far settles relevance, None while undecided
+        """
+        # Check if response contains irrelevant indicators
+        if self.seen & _IRRELEVANT:
+            return False
+        
+        # Check if response or question contains Paul Graham related content;
+        # the question is only looked at when the response alone doesn't decide
+        if self.seen & _PG or self._question_has_pg():
+            return True
+        
+        # Additional check: if response is very short and generic, it's likely irrelevant
+        if self.stripped_length() < 50:
+            return None
+        
+        # If response mentions specific concepts that could be in essays, consider it relevant
+        if self.seen & _CONCEPT:
+            return True
+        
+        return None
 
 def is_relevant_response(response_text, question):
     """
     Check if the response is relevant to Paul Graham's essays
     Returns True if relevant, False if off-topic
     """
-    # Keywords that indicate the response is from Paul Graham's content
-    pg_indicators = [
-        "paul graham", "y combinator", "yc", "startup", "lisp", "viaweb",
-        "hacker", "programming", "essay", "venture capital", "silicon valley",
-        "founder", "entrepreneur", "technology", "software", "computer science",
-        "arc", "painting", "art", "harvard", "mit", "writer", "investor"
-    ]
-    
-    # Generic responses that indicate lack of relevant information
-    irrelevant_indicators = [
-        "i don't know", "i'm not sure", "i don't have information",
-        "i cannot find", "no information", "not mentioned", "unclear",
-        "i apologize", "i'm sorry", "i don't have access",
-        "based on general knowledge", "in general", "typically",
-        "i don't have information about this topic in paul graham's essays"
-    ]
-    
-    response_lower = response_text.lower()
-    question_lower = question.lower()
-    
-    # Check if response contains irrelevant indicators
-    if any(indicator in response_lower for indicator in irrelevant_indicators):
-        return False
-    
-    # Check if response or question contains Paul Graham related content
-    if any(indicator in response_lower or indicator in question_lower for indicator in pg_indicators):
-        return True
-    
-    # Additional check: if response is very short and generic, it's likely irrelevant
-    if len(response_text.strip()) < 50:
-        return False
-    
-    # If response mentions specific concepts that could be in essays, consider it relevant
-    concept_indicators = [
-        "according to", "mentioned", "discussed", "explained", "wrote about",
-        "believes", "argues", "suggests", "recommends", "experience", "opinion"
-    ]
-    
-    if any(indicator in response_lower for indicator in concept_indicators):
-        return True
-    
+    scanner = RelevanceScanner(question)
+    scanner.feed(response_text)
     # Default to irrelevant if no clear indicators
-    return False
+    return scanner.verdict() is True
+
+# Polite replies explaining the system's scope for off-topic questions
+SCOPE_LIMITATION_MESSAGES = (
+    "I'm sorry, but I can only provide information based on Paul Graham's essays. Please ask me about topics related to startups, programming, Y Combinator, or other subjects Paul Graham has written about.",
+    
+    "I specialize in answering questions about Paul Graham's essays and insights. Could you please ask something related to startups, programming, entrepreneurship, or other topics he's covered in his writings?",
+    
+    "My knowledge is limited to Paul Graham's essays and writings. I'd be happy to help with questions about startups, Y Combinator, programming languages, or other topics he's discussed.",
+    
+    "I can only answer questions based on Paul Graham's essays. Please feel free to ask about startups, programming, venture capital, or any other topics from his writings.",
+    
+    "I'm designed to answer questions specifically about Paul Graham's essays and insights. Could you ask something related to entrepreneurship, programming, or other subjects he's written about?"
+)
+_SCOPE_RNG = random.Random()
 
 def get_scope_limitation_message():
     """
     Return a polite message explaining the system's scope
     """
-    messages = [
-        "I'm sorry, but I can only provide information based on Paul Graham's essays. Please ask me about topics related to startups, programming, Y Combinator, or other subjects Paul Graham has written about.",
-        
-        "I specialize in answering questions about Paul Graham's essays and insights. Could you please ask something related to startups, programming, entrepreneurship, or other topics he's covered in his writings?",
-        
-        "My knowledge is limited to Paul Graham's essays and writings. I'd be happy to help with questions about startups, Y Combinator, programming languages, or other topics he's discussed.",
-        
-        "I can only answer questions based on Paul Graham's essays. Please feel free to ask about startups, programming, venture capital, or any other topics from his writings.",
+    return _SCOPE_RNG.choice(SCOPE_LIMITATION_MESSAGES)
+
+def _response_chunks(streaming_response):
+    response_gen = getattr(streaming_response, "response_gen", None)
+    if response_gen is None:
+        # Fallback for non-streaming response
+        return [str(streaming_response)]
+    return response_gen
+
+def _stream_relevant_chunks(streaming_response, question, response_cache, question_vec):
+    parts = []
+    # Matches each chunk once as it arrives instead of rescanning the prefix
+    scanner = RelevanceScanner(question)
+    streaming = False
+    for chunk in _response_chunks(streaming_response):
+        parts.append(chunk)
+        scanner.feed(chunk)
+        if streaming:
+            yield chunk
+            continue
         
-        "I'm designed to answer questions specifically about Paul Graham's essays and insights. Could you ask something related to entrepreneurship, programming, or other subjects he's written about?"
-    ]
+        # Hold chunks back until the prefix settles relevance
+        verdict = scanner.verdict()
+        if verdict is False:
+            yield get_scope_limitation_message()
+            return
+        if verdict and scanner.length >= RELEVANCE_PREFIX_CHARS:
+            streaming = True
+            yield "".join(parts)
     
-    return random.choice(messages)
+    # The scanner has now seen the whole answer, so this is the full-text check;
+    # a streamed answer is already out, but only one that passes gets cached
+    if scanner.verdict() is True:
+        response_text = "".join(parts)
+        response_cache.put(question, question_vec, response_text)
+        if not streaming:
+            yield response_text
+    elif not streaming:
+        yield get_scope_limitation_message()
 
-def query_rag_system(query_engine, question):
-    # First, get the RAG response
-    streaming_response = query_engine.query(question)
-    
-    # Convert streaming response to string
-    response_text = ""
-    try:
-        for chunk in streaming_response.response_gen:
-            response_text += chunk
-    except:
-        # Fallback for non-streaming response
-        response_text = str(streaming_response)
+def stream_rag_system(query_engine, response_cache, question):
+    """
+    Run the query and return an iterator over the answer's text chunks
+    """
+    cached_response, question_vec = response_cache.get(question)
+    if cached_response is not None:
+        return iter([cached_response])
     
-    # Check if the response is relevant to Paul Graham's content
-    if is_relevant_response(response_text, question):
-        return response_text
-    else:
-        return get_scope_limitation_message()
\ No newline at end of file
+    # Retrieval and the LLM call start here, so errors surface before streaming
+    streaming_response = query_engine.query(question)
+    return _stream_relevant_chunks(streaming_response, question, response_cache, question_vec)
@@ -29,7 +29,8 @@ const App = () => {
   }, [messages]);
 
   // ✅ Use API_BASE_URL dynamically
-  const queryRAGSystem = async (question) => {
+  // ✅ The backend streams the answer as plain text; report it as it arrives
+  const queryRAGSystem = async (question, onChunk) => {
     try {
       const response = await fetch(`${API_BASE_URL}/api/query`, {
         method: 'POST',
@@ -43,8 +44,16 @@ const App = () => {
         throw new Error('API request failed');
       }
       
-      const data = await response.json();
-      return data.response;
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let text = '';
+      while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        text += decoder.decode(value, { stream: true });
+        onChunk(text);
+      }
+      return text + decoder.decode();
     } catch (error) {
       console.error('Error querying RAG system:', error);
       return "Sorry, I encountered an error while processing your question. Please make sure the backend server is running.";
@@ -65,25 +74,20 @@ const App = () => {
     setInputMessage('');
     setIsLoading(true);
 
+    const botMessageId = Date.now() + 1;
+    const showBotMessage = (content) => {
+      setIsLoading(false);
+      setMessages(prev => prev.some(message => message.id === botMessageId)
+        ? prev.map(message => message.id === botMessageId ? { ...message, content } : message)
+        : [...prev, { id: botMessageId, type: 'bot', content, timestamp: new Date() }]
+      );
+    };
+
     try {
-      const response = await queryRAGSystem(inputMessage);
-      
-      const botMessage = {
-        id: Date.now() + 1,
-        type: 'bot',
-        content: response,
-        timestamp: new Date()
-      };
-
-      setMessages(prev => [...prev, botMessage]);
+      const response = await queryRAGSystem(inputMessage, showBotMessage);
+      showBotMessage(response);
     } catch (error) {
-      const errorMessage = {
-        id: Date.now() + 1,
-        type: 'bot',
-        content: "Sorry, I encountered an error while processing your question. Please try again.",
-        timestamp: new Date()
-      };
-      setMessages(prev => [...prev, errorMessage]);
+      showBotMessage("Sorry, I encountered an error while processing your question. Please try again.");
     }
 
     setIsLoading(false);